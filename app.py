@@ -1,9 +1,13 @@
-import mimetypes
+import io
 import os
+import threading
 import urllib.parse
 import uuid
-from pathlib import Path
-from flask import Flask, render_template, request, redirect, url_for
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from cachetools import TTLCache, cached
+from flask import Flask, jsonify, make_response, render_template, request, redirect, url_for
+from requests.adapters import HTTPAdapter
 from werkzeug.utils import secure_filename
 from watermark import apply_watermark  # your watermark function
 from firebase_admin import credentials, initialize_app, storage, firestore
@@ -14,6 +18,7 @@ app = Flask(__name__)
 app.config['UPLOAD_FOLDER'] = 'static/images/originals'
 app.config['WATERMARKED_FOLDER'] = 'static/images/watermarked'
 app.config['ALLOWED_EXTENSIONS'] = {'png', 'jpg', 'jpeg', 'gif'}
+app.config['PAGE_SIZE'] = 50  # photos per gallery/admin page
 
 # --- Firebase init ---
 app.config['FIREBASE_STORAGE_BUCKET'] = os.environ.get(
@@ -28,70 +33,240 @@ initialize_app(cred, {"storageBucket": app.config['FIREBASE_STORAGE_BUCKET']})
 # Firestore client (use `fs`, not `db`, to avoid confusion with prior SQLAlchemy var)
 fs = firestore.client()
 
+# Storage bucket handle (bucket name is fixed by config, resolve once)
+bucket = storage.bucket()
+
+# The storage client's AuthorizedSession already keeps connections alive; widen
+# its pool so concurrent uploads reuse TLS connections instead of dropping them
+# (requests' default keeps only 10 per host)
+bucket.client._http.mount("https://", HTTPAdapter(pool_connections=16, pool_maxsize=16))
+
+# Fields each view actually renders (server-side projection; doc id always comes back)
+PUBLIC_PHOTO_FIELDS = ['filename', 'category', 'storage_url']
+ADMIN_PHOTO_FIELDS = PUBLIC_PHOTO_FIELDS + ['is_featured', 'price']
+PUBLIC_PRICE_FIELDS = ['label', 'amount']
+ADMIN_PRICE_FIELDS = ['item_type', 'label', 'amount']
+
 # --------- Helpers ---------
+_ALLOWED_SUFFIXES = tuple('.' + ext for ext in app.config['ALLOWED_EXTENSIONS'])
+
 def allowed_file(filename: str) -> bool:
-    return '.' in filename and filename.rsplit('.', 1)[1].lower() in app.config['ALLOWED_EXTENSIONS']
+    return filename.lower().endswith(_ALLOWED_SUFFIXES)
 
-def upload_to_firebase(local_path: str, dest_path: str) -> str:
+def upload_to_firebase(fileobj, dest_path: str, content_type: str = "image/jpeg") -> str:
     """
-    Uploads a file to Firebase Storage at dest_path and returns a durable download URL
-    using a firebaseStorageDownloadTokens token.
+    Uploads an in-memory file (BytesIO) to Firebase Storage at dest_path and returns a
+    durable download URL using a firebaseStorageDownloadTokens token.
     """
-    bucket = storage.bucket()
     blob = bucket.blob(dest_path)
 
-    # Guess content type
-    ctype, _ = mimetypes.guess_type(local_path)
-    if not ctype:
-        ctype = "application/octet-stream"
-
     # Generate a token to allow direct download
     token = uuid.uuid4().hex
     blob.metadata = {"firebaseStorageDownloadTokens": token}
 
-    # Upload file
-    blob.upload_from_filename(local_path, content_type=ctype)
+    # Object names are unique per upload, so the content never changes
+    blob.cache_control = "public, max-age=31536000, immutable"
+
+    # Upload from the current stream position (caller rewinds). Passing the size
+    # keeps small files on a single multipart request instead of a resumable session
+    size = fileobj.getbuffer().nbytes - fileobj.tell()
+    blob.upload_from_file(fileobj, size=size, content_type=content_type, rewind=False)
 
     # Construct public download URL (token-based)
     quoted_name = urllib.parse.quote(blob.name, safe="")
     url = f"https://firebasestorage.googleapis.com/v0/b/{bucket.name}/o/{quoted_name}?alt=media&token={token}"
     return url
 
+def upload_many_to_firebase(items, max_workers: int = 8) -> list:
+    """
+    Uploads (fileobj, dest_path) pairs concurrently and returns their download URLs
+    in the same order. Storage uploads are network-bound, so threads overlap them.
+    """
+    if len(items) == 1:
+        return [upload_to_firebase(*items[0])]
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(items))) as pool:
+        return list(pool.map(lambda item: upload_to_firebase(*item), items))
+
+def categories_ref():
+    """Single aggregate doc holding every category in use (avoids scanning photos)."""
+    return fs.collection('aggregates').document('categories')
+
+def record_category(category: str) -> None:
+    categories_ref().set({'values': firestore.ArrayUnion([category])}, merge=True)
+
+def load_categories() -> list:
+    snap = categories_ref().get()
+    if snap.exists:
+        return (snap.to_dict() or {}).get('values', [])
+    # First run: build from existing photos once and store the aggregate
+    values = sorted({(d.to_dict() or {}).get('category')
+                     for d in fs.collection('photos').select(['category']).stream()} - {None, ''})
+    # Merge + ArrayUnion so a concurrent record_category() isn't overwritten
+    categories_ref().set({'values': firestore.ArrayUnion(values)}, merge=True)
+    return values
+
+def photos_page(category=None, after=None, fields=None):
+    """
+    One page of photos ordered by doc id, optionally filtered by category,
+    projected to `fields` and starting after the `after` doc id.
+    Returns (photos, next_cursor).
+    """
+    col = fs.collection('photos')
+    query = col.where('category', '==', category) if category else col
+    if fields:
+        query = query.select(fields)
+    query = query.order_by('__name__').limit(app.config['PAGE_SIZE'])
+    if after:
+        # A __name__ cursor is turned into a doc reference by the client: no extra
+        # read, and it still works if that photo has since been deleted
+        query = query.start_after({'__name__': after})
+    photos = [doc_to_dict(d) for d in query.stream()]
+    return photos, next_cursor(photos)
+
+def next_cursor(photos):
+    """Doc id to continue from, or None on the last page."""
+    return photos[-1]['id'] if len(photos) == app.config['PAGE_SIZE'] else None
+
+def wants_json() -> bool:
+    """True when the client prefers JSON over HTML (API callers vs. form posts)."""
+    return request.accept_mimetypes.best_match(['text/html', 'application/json']) == 'application/json'
+
+def cacheable(html: str):
+    """Wrap rendered public HTML with short shared caching + ETag (304 on match)."""
+    resp = make_response(html)
+    resp.headers['Cache-Control'] = 'public, max-age=60, stale-while-revalidate=300'
+    resp.add_etag()
+    return resp.make_conditional(request)
+
 def doc_to_dict(doc):
     """Convert a Firestore DocumentSnapshot to a dict with 'id'."""
     d = doc.to_dict() or {}
     d["id"] = doc.id
     return d
 
+# --------- Cached list queries ---------
+# Short per-process TTL cache for rarely-changing collections; each gunicorn worker
+# keeps its own copy, writes below invalidate the local worker immediately.
+_query_cache = TTLCache(maxsize=32, ttl=60)
+_query_cache_lock = threading.Lock()  # TTLCache is not thread-safe
+
+_QUERIES = {
+    'featured':       lambda: (fs.collection('photos').where('is_featured', '==', True)
+                               .select(PUBLIC_PHOTO_FIELDS).stream()),
+    'gallery_all':    lambda: (fs.collection('photos').select(PUBLIC_PHOTO_FIELDS).order_by('__name__')
+                               .limit(app.config['PAGE_SIZE']).stream()),  # first page
+    'prices_service': lambda: (fs.collection('prices').where('item_type', '==', 'Service')
+                               .select(PUBLIC_PRICE_FIELDS).stream()),
+    'prices_print':   lambda: (fs.collection('prices').where('item_type', '==', 'Print')
+                               .select(PUBLIC_PRICE_FIELDS).stream()),
+}
+
+@cached(_query_cache, key=lambda name: name, lock=_query_cache_lock)
+def cached_query(name: str) -> list:
+    return [doc_to_dict(d) for d in _QUERIES[name]()]
+
+def invalidate_cache(*names: str) -> None:
+    with _query_cache_lock:
+        for name in names:
+            _query_cache.pop(name, None)
+
+# --------- Background upload jobs ---------
+# Watermarking + Storage upload run off the request thread. Job state lives in
+# Firestore (upload_jobs/<job_id>) so any gunicorn worker can answer a status poll.
+_upload_executor = ThreadPoolExecutor(max_workers=2)
+
+# Queued jobs hold their raw uploads in memory, so cap jobs in flight per worker
+MAX_UPLOAD_JOBS = int(os.environ.get("MAX_UPLOAD_JOBS", "4"))
+_upload_slots = threading.BoundedSemaphore(MAX_UPLOAD_JOBS)
+
+# A job still pending after this long was lost (e.g. its worker was recycled)
+UPLOAD_JOB_TIMEOUT = timedelta(minutes=10)
+
+def upload_job_ref(job_id: str):
+    return fs.collection('upload_jobs').document(job_id)
+
+def run_upload_job(job_id: str, items, category: str) -> None:
+    """Runs process_upload_job and records the outcome on the job doc."""
+    try:
+        public_urls = process_upload_job(items, category)
+    except Exception as e:
+        app.logger.exception("Upload job %s failed", job_id)
+        upload_job_ref(job_id).update({'status': 'failed', 'error': str(e)})
+    else:
+        upload_job_ref(job_id).update({'status': 'done', 'urls': public_urls})
+
+def load_upload_job(job_id: str):
+    """Job state as {'status', 'urls'?, 'error'?}, or None for an unknown job id."""
+    snap = upload_job_ref(job_id).get()
+    if not snap.exists:
+        return None
+    job = snap.to_dict() or {}
+    created_at = job.get('created_at')
+    if (job.get('status') == 'pending' and created_at
+            and datetime.now(timezone.utc) - created_at > UPLOAD_JOB_TIMEOUT):
+        return {'status': 'failed', 'error': "Upload was interrupted, please upload the photo again."}
+    return {k: job[k] for k in ('status', 'urls', 'error') if k in job}
+
+def process_upload_job(items, category: str) -> list:
+    """
+    Watermarks (safe_filename, raw_fileobj) pairs, uploads them to Firebase Storage
+    and records their metadata. Returns the public URLs.
+    """
+    # Watermark each upload in memory (no temp files)
+    watermarked = []
+    for safe_filename, raw in items:
+        buf = io.BytesIO()
+        apply_watermark(raw, buf)
+        buf.seek(0)
+        watermarked.append((buf, f"{category}/{safe_filename}"))
+
+    # Upload watermarked files to Firebase Storage concurrently
+    public_urls = upload_many_to_firebase(watermarked)
+
+    # Save metadata in Firestore
+    batch = fs.batch()
+    col = fs.collection('photos')
+    for (safe_filename, _), public_url in zip(items, public_urls):
+        batch.set(col.document(), {
+            'filename': safe_filename,
+            'category': category,
+            'is_featured': False,
+            'price': 0.0,
+            'storage_url': public_url,
+        })
+    batch.commit()
+    record_category(category)
+    invalidate_cache('featured', 'gallery_all')
+    return public_urls
+
 # --------- Routes ---------
 
 @app.route('/')
 def home():
     # featured photos only
-    snaps = fs.collection('photos').where('is_featured', '==', True).stream()
-    photos = [doc_to_dict(d) for d in snaps]
-    return render_template('index.html', photos=photos)
+    photos = cached_query('featured')
+    return cacheable(render_template('index.html', photos=photos))
 
 @app.route('/gallery')
 def gallery():
     category_filter = request.args.get('category', 'all')
-    col = fs.collection('photos')
+    after = request.args.get('after')
 
-    if category_filter == 'all':
-        snaps = col.stream()
+    if category_filter == 'all' and not after:
+        photos = cached_query('gallery_all')
+        after_id = next_cursor(photos)
     else:
-        snaps = col.where('category', '==', category_filter).stream()
+        photos, after_id = photos_page(None if category_filter == 'all' else category_filter, after,
+                                       fields=PUBLIC_PHOTO_FIELDS)
 
-    photos = [doc_to_dict(d) for d in snaps]
+    # Categories come from the aggregate doc (1 read instead of N)
+    categories = ['all'] + sorted(load_categories())
 
-    # Build categories dynamically from data
-    cat_snaps = col.select(['category']).stream()
-    categories = ['all'] + sorted({(d.to_dict() or {}).get('category') for d in cat_snaps if (d.to_dict() or {}).get('category')})
-
-    return render_template('gallery.html',
-                           photos=photos,
-                           selected_category=category_filter,
-                           categories=categories)
+    return cacheable(render_template('gallery.html',
+                                     photos=photos,
+                                     selected_category=category_filter,
+                                     categories=categories,
+                                     next_after=after_id))
 
 @app.route('/upload', methods=['GET', 'POST'])
 def upload():
@@ -102,76 +277,67 @@ def upload():
         if 'photo' not in request.files:
             return "No file part", 400
 
-        file = request.files['photo']
+        files = [f for f in request.files.getlist('photo') if f.filename]
         category = request.form.get('category')
 
         if not category or category not in categories:
             return "Invalid or missing category", 400
-        if file.filename == '':
+        if not files:
             return "No selected file", 400
-        if not allowed_file(file.filename):
+        if not all(allowed_file(f.filename) for f in files):
             return "Invalid file type", 400
 
-        # Ensure temp folders exist (ephemeral OK)
-        os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
-        os.makedirs(app.config['WATERMARKED_FOLDER'], exist_ok=True)
-
-        # Unique safe filename
-        ext = Path(file.filename).suffix.lower()
-        filename = f"{uuid.uuid4().hex}{ext}"
-        safe_filename = secure_filename(filename)
-
-        original_path = os.path.join(app.config['UPLOAD_FOLDER'], safe_filename)
-        watermarked_path = os.path.join(app.config['WATERMARKED_FOLDER'], safe_filename)
-
-        # Save original locally
-        file.save(original_path)
-
-        # Apply watermark
-        apply_watermark(original_path, watermarked_path)
-
-        # Upload watermarked to Firebase Storage
-        dest_path = f"{category}/{safe_filename}"
+        if not _upload_slots.acquire(blocking=False):
+            return ("Too many uploads in progress, please try again shortly", 503,
+                    {'Retry-After': '30'})
         try:
-            public_url = upload_to_firebase(watermarked_path, dest_path)
-        except Exception as e:
-            # Clean up and report
-            try:
-                os.remove(original_path)
-                os.remove(watermarked_path)
-            except OSError:
-                pass
-            return (f"Upload to Firebase failed: {e}", 500)
-
-        # Save metadata in Firestore
-        fs.collection('photos').add({
-            'filename': safe_filename,
-            'category': category,
-            'is_featured': False,
-            'price': 0.0,
-            'storage_url': public_url,
-        })
-
-        # Clean up local temp files
-        for p in (original_path, watermarked_path):
-            try:
-                os.remove(p)
-            except OSError:
-                pass
-
-        return redirect(url_for('gallery'))
+            # Buffer the raw uploads (the request stream closes once we respond) and
+            # hand the heavy work to the background pool
+            items = [
+                # Unique safe filename (always stored as JPEG after watermarking)
+                (secure_filename(f"{uuid.uuid4().hex}.jpg"), io.BytesIO(file.read()))
+                for file in files
+            ]
+            job_id = uuid.uuid4().hex
+            upload_job_ref(job_id).set({
+                'status': 'pending',
+                'category': category,
+                'created_at': firestore.SERVER_TIMESTAMP,
+            })
+            job = _upload_executor.submit(run_upload_job, job_id, items, category)
+        except Exception:
+            _upload_slots.release()
+            raise
+        # Free the slot once the job finishes, however it ends
+        job.add_done_callback(lambda _: _upload_slots.release())
+
+        status_url = url_for('upload_status', job_id=job_id)
+        if wants_json():
+            return jsonify({'job_id': job_id, 'status_url': status_url}), 202
+        # Form posts land on a page that shows the result once the job finishes
+        return redirect(status_url)
 
     return render_template('upload.html', categories=categories)
 
+@app.route('/upload/status/<job_id>')
+def upload_status(job_id):
+    job = load_upload_job(job_id)
+    if wants_json():
+        if job is None:
+            return jsonify({'status': 'unknown'}), 404
+        return jsonify(job), {'pending': 202, 'failed': 500}.get(job['status'], 200)
+    # The page itself rendered fine; the job outcome is shown in its content
+    return render_template('upload_status.html', job=job), 404 if job is None else 200
+
 @app.route('/about')
 def about():
-    return render_template('about.html')
+    return cacheable(render_template('about.html'))
 
 @app.route('/pricing')
 def pricing():
-    services = [doc_to_dict(d) for d in fs.collection('prices').where('item_type', '==', 'Service').stream()]
-    prints   = [doc_to_dict(d) for d in fs.collection('prices').where('item_type', '==', 'Print').stream()]
-    return render_template('pricing.html', services=services, prints=prints)
+    services = cached_query('prices_service')
+    prints   = cached_query('prices_print')
+    return cacheable(render_template('pricing.html', services=services, prints=prints))
 
 @app.route("/admin/seed-prices")
 def seed_prices():
@@ -192,6 +358,7 @@ def seed_prices():
         ref = col.document()  # auto id
         batch.set(ref, p)
     batch.commit()
+    invalidate_cache('prices_service', 'prices_print')
     return "Seeded prices successfully!"
 
 @app.route('/admin/prices', methods=['POST'])
@@ -203,6 +370,7 @@ def update_price():
     if price_id:
         ref = fs.collection('prices').document(price_id)
         ref.update({"label": label, "amount": amount})
+        invalidate_cache('prices_service', 'prices_print')
 
     return redirect('/admin')
 
@@ -220,10 +388,17 @@ def admin():
             if category:
                 updates['category'] = category
             ref.update(updates)
-
-    photos = [doc_to_dict(d) for d in fs.collection('photos').stream()]
-    prices = [doc_to_dict(d) for d in fs.collection('prices').stream()]
-    return render_template('admin.html', photos=photos, prices=prices)
+            if category:
+                record_category(category)
+            invalidate_cache('featured', 'gallery_all')
+
+    category_filter = request.args.get('category') or None
+    photos, after_id = photos_page(category_filter, request.args.get('after'), fields=ADMIN_PHOTO_FIELDS)
+    prices = [doc_to_dict(d) for d in fs.collection('prices').select(ADMIN_PRICE_FIELDS).stream()]
+    return render_template('admin.html', photos=photos, prices=prices,
+                           categories=sorted(load_categories()),
+                           selected_category=category_filter,
+                           next_after=after_id)
 
 # --- Local dev runner (Render will use gunicorn start command) ---
 if __name__ == "__main__":
@@ -0,0 +1,26 @@
+# gunicorn.conf.py (picked up automatically by `gunicorn app:app`)
+import multiprocessing
+import os
+
+def _usable_cpus() -> int:
+    # CPUs this process may run on (what `nproc` reports); cpu_count() ignores
+    # affinity/container limits and would size workers to the whole host
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:  # not available on macOS
+        return multiprocessing.cpu_count()
+
+# Threaded workers so Firebase/Firestore I/O overlaps across requests while
+# PIL work spreads over processes
+worker_class = "gthread"
+workers = int(os.getenv("WEB_CONCURRENCY", _usable_cpus()))
+threads = int(os.getenv("GUNICORN_THREADS", "8"))
+timeout = 120
+
+# Heartbeat files on tmpfs instead of a possibly slow disk
+if os.path.isdir("/dev/shm"):
+    worker_tmp_dir = "/dev/shm"
+
+# Don't preload: Firebase/gRPC clients are created on import and must not be
+# shared across forked workers
+preload_app = False
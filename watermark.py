@@ -1,6 +1,8 @@
 # watermark.py
 import os, base64, tempfile, math
-from PIL import Image, ImageDraw, ImageFont, ImageFilter
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont
+from scipy.ndimage import gaussian_filter
 
 WATERMARK_TEXT = "Rogers Photography"
 
@@ -32,7 +34,14 @@ SHADOW_OPACITY = 80
 SHADOW_OFFSET_DISTANCE = 10
 SHADOW_ANGLE_DEGREES = -90
 SHADOW_BLUR_RADIUS = 20
+SHADOW_SCALE = 4  # shadow is rendered/blurred at 1/SHADOW_SCALE resolution
 TEXT_FILL = (255, 255, 255, 160)
+MASTER_FONT_SIZE = 200  # largest watermark size; smaller images scale it down
+
+# --- Output encoding (single-pass baseline JPEG) ---
+JPEG_QUALITY = 90
+# Longest edge of watermarked output in px (0 keeps the original size)
+MAX_DIM = int(os.getenv("WATERMARK_MAX_DIM", "1600"))
 
 def load_snell_font(size: int) -> ImageFont.FreeTypeFont:
     # Try decoded TTC first
@@ -50,63 +59,90 @@ def load_snell_font(size: int) -> ImageFont.FreeTypeFont:
     # Last resort
     return ImageFont.load_default()
 
-def find_max_font_size(text, image_width):
-    size = 200
-    while size > 1:
-        font = load_snell_font(size)
-        dummy = Image.new("RGBA", (100, 100))
-        draw = ImageDraw.Draw(dummy)
-        bbox = draw.textbbox((0, 0), text, font=font)
-        if (bbox[2] - bbox[0]) <= image_width - 20:
-            return font
-        size -= 1
-    return load_snell_font(10)
-
-def apply_watermark(input_path, output_path):
-    image = Image.open(input_path).convert("RGBA")
-    base = image.copy()
-
-    font = find_max_font_size(WATERMARK_TEXT, image.width)
-
-    tmp_draw = ImageDraw.Draw(Image.new("RGBA", image.size))
-    bbox = tmp_draw.textbbox((0, 0), WATERMARK_TEXT, font=font)
-    text_w = bbox[2] - bbox[0]
-    text_h = bbox[3] - bbox[1]
+def _render_master_mask() -> Image.Image:
+    """Rasterize WATERMARK_TEXT once at MASTER_FONT_SIZE into an L mask cropped to its ink."""
+    font = load_snell_font(MASTER_FONT_SIZE)
+    draw = ImageDraw.Draw(Image.new("L", (1, 1)))
+    bbox = draw.textbbox((0, 0), WATERMARK_TEXT, font=font, stroke_width=1)
+    mask = Image.new("L", (max(1, bbox[2] - bbox[0]), max(1, bbox[3] - bbox[1])), 0)
+    # Stroke can “thicken” fallback fonts
+    ImageDraw.Draw(mask).text(
+        (-bbox[0], -bbox[1]), WATERMARK_TEXT, font=font, fill=255, stroke_width=1, stroke_fill=255
+    )
+    return mask
+
+# The text never changes, so glyphs are rasterized once and each image just
+# resamples this mask instead of re-fitting and re-rendering the font
+_MASTER_MASK = _render_master_mask()
+
+def apply_watermark(in_fp, out_fp):
+    """in_fp/out_fp may be file paths or binary file-like objects."""
+    image = Image.open(in_fp)
+    # Work in RGB (what JPEGs decode to and what we save); only the small overlay
+    # needs alpha. Convert before resizing: Pillow resizes "P"/"1" images with
+    # NEAREST regardless of the filter asked for
+    if image.mode not in ("RGB", "L"):
+        image = image.convert("RGB")
+    # Output is for web display, so shrink first; every later pass (and the
+    # JPEG decode, via draft mode) then works on far fewer pixels
+    if MAX_DIM and max(image.size) > MAX_DIM:
+        image.thumbnail((MAX_DIM, MAX_DIM), Image.LANCZOS)
+    base = image if image.mode == "RGB" else image.convert("RGB")
+
+    # Scale the text to fit the width (never larger than the master rendering)
+    PADDING = 20
+    text_w = max(1, min(_MASTER_MASK.width, base.width - PADDING))
+    text_h = max(1, round(text_w * _MASTER_MASK.height / _MASTER_MASK.width))
+    text_mask = _MASTER_MASK.resize((text_w, text_h), Image.LANCZOS)
 
     # Bottom-right with padding
-    PADDING = 20
-    x = image.width - text_w - PADDING
-    y = image.height - text_h - PADDING
+    x = base.width - text_w - PADDING
+    y = base.height - text_h - PADDING
 
     # Shadow offset
     theta = math.radians(SHADOW_ANGLE_DEGREES)
     dx = int(round(SHADOW_OFFSET_DISTANCE * math.cos(theta)))
     dy = int(round(SHADOW_OFFSET_DISTANCE * math.sin(theta)))
 
-    # Shadow layer
-    shadow_layer = Image.new("RGBA", image.size, (0, 0, 0, 0))
-    ImageDraw.Draw(shadow_layer).text(
-        (x + dx, y + dy), WATERMARK_TEXT, font=font, fill=(0, 0, 0, SHADOW_OPACITY)
+    # Overlay only covers the text plus shadow offset/blur falloff (clipped to the
+    # image), not a full-size canvas
+    pad = SHADOW_BLUR_RADIUS * 3 + max(abs(dx), abs(dy))
+    left = max(0, x - pad)
+    top = max(0, y - pad)
+    right = min(base.width, x + text_w + pad)
+    bottom = min(base.height, y + text_h + pad)
+    layer_size = (right - left, bottom - top)
+
+    # Shadow: only alpha varies (RGB is constant black), so build + blur a single
+    # "L" mask. It is low-frequency too, so do it at 1/SHADOW_SCALE resolution and
+    # upscale, instead of a big-radius blur at full resolution
+    shadow_mask = Image.new(
+        "L",
+        (max(1, layer_size[0] // SHADOW_SCALE), max(1, layer_size[1] // SHADOW_SCALE)),
+        0
     )
-    shadow_blurred = shadow_layer.filter(ImageFilter.GaussianBlur(radius=SHADOW_BLUR_RADIUS))
-
-    # Composite shadow
-    composed = Image.alpha_composite(base, shadow_blurred)
-
-    # Text layer (stroke can “thicken” fallback fonts)
-    text_layer = Image.new("RGBA", image.size, (0, 0, 0, 0))
-    text_draw = ImageDraw.Draw(text_layer)
-    text_draw.text(
-        (x, y),
-        WATERMARK_TEXT,
-        font=font,
-        fill=TEXT_FILL,
-        stroke_width=1,
-        stroke_fill=TEXT_FILL
+    shadow_text = _MASTER_MASK.resize(
+        (max(1, text_w // SHADOW_SCALE), max(1, text_h // SHADOW_SCALE)), Image.BILINEAR
+    ).point(lambda v: v * SHADOW_OPACITY // 255)
+    shadow_mask.paste(shadow_text, ((x + dx - left) // SHADOW_SCALE, (y + dy - top) // SHADOW_SCALE))
+    # Pillow's blur radius is the Gaussian standard deviation, so it maps to sigma
+    blurred = gaussian_filter(
+        np.asarray(shadow_mask), sigma=SHADOW_BLUR_RADIUS / SHADOW_SCALE, mode="constant"
     )
+    shadow_alpha = np.asarray(Image.fromarray(blurred).resize(layer_size, Image.BILINEAR))
+
+    # Black RGB + blurred alpha
+    overlay = Image.fromarray(
+        np.dstack((np.zeros(shadow_alpha.shape + (3,), dtype=np.uint8), shadow_alpha))
+    )
+
+    # Text goes straight onto the shadow layer so the image only needs a single
+    # composite pass
+    overlay.paste(TEXT_FILL, (x - left, y - top), mask=text_mask)
 
-    composed = Image.alpha_composite(composed, text_layer)
-    composed.convert("RGB").save(output_path, "JPEG", quality=95)
+    # Pasting with the overlay as its own mask blends it over the opaque base
+    base.paste(overlay, (left, top), mask=overlay)
+    base.save(out_fp, "JPEG", quality=JPEG_QUALITY, optimize=False, progressive=False)
 
 # --- Optional: quick debug helpers you can import from app.py ---
 def font_debug_info():